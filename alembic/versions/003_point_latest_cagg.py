@@ -0,0 +1,82 @@
+"""serve v_point_latest from a continuous aggregate
+
+Revision ID: 003_point_latest_cagg
+Revises: 002_init_hvac_timescale
+Create Date: 2026-10-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "003_point_latest_cagg"
+down_revision = "002_init_hvac_timescale"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # =====================================================
+    # Hourly continuous aggregate (replaces full-scan MV)
+    # =====================================================
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS v_point_latest;")
+
+    # WITH NO DATA so this can run inside the migration transaction;
+    # materialized_only = false keeps the not-yet-materialized tail visible.
+    op.execute("""
+    CREATE MATERIALIZED VIEW v_point_latest_hourly
+    WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+    SELECT
+      time_bucket('1 hour', m.ts_utc) AS bucket,
+      m.site_id,
+      m.point_id,
+      last(m.point_name, m.ts_utc) AS point_name,
+      last(m.unit, m.ts_utc) AS unit,
+      last(m.value, m.ts_utc) AS value,
+      last(m.quality, m.ts_utc) AS quality,
+      max(m.ts_utc) AS last_ts_utc
+    FROM measurements m
+    GROUP BY bucket, m.site_id, m.point_id
+    WITH NO DATA;
+    """)
+    op.execute("""
+    SELECT add_continuous_aggregate_policy(
+        'v_point_latest_hourly',
+        start_offset => INTERVAL '2 days',
+        end_offset => INTERVAL '1 hour',
+        schedule_interval => INTERVAL '5 minutes',
+        if_not_exists => TRUE
+    );
+    """)
+
+    # Backfill existing history once; refresh cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.execute("CALL refresh_continuous_aggregate('v_point_latest_hourly', NULL, NULL);")
+
+    # =====================================================
+    # Per-point latest, same shape as the old MV
+    # =====================================================
+    op.execute("""
+    CREATE OR REPLACE VIEW v_point_latest AS
+    SELECT DISTINCT ON (l.point_id)
+      l.point_id, l.site_id, l.point_name, l.unit,
+      l.last_ts_utc, l.value, l.quality
+    FROM v_point_latest_hourly l
+    ORDER BY l.point_id, l.bucket DESC;
+    """)
+
+
+def downgrade():
+    op.execute("DROP VIEW IF EXISTS v_point_latest;")
+    op.execute("SELECT remove_continuous_aggregate_policy('v_point_latest_hourly', if_exists => TRUE);")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS v_point_latest_hourly;")
+
+    op.execute("""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS v_point_latest AS
+    SELECT DISTINCT ON (m.point_id)
+      m.point_id, m.site_id, m.point_name, m.unit,
+      m.ts_utc AS last_ts_utc, m.value, m.quality
+    FROM measurements m
+    ORDER BY m.point_id, m.ts_utc DESC;
+    """)
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_v_point_latest ON v_point_latest(point_id);")
@@ -0,0 +1,48 @@
+"""rewrite v_site_latest_window as a per-point LATERAL lookup
+
+Revision ID: 004_site_latest_window_lateral
+Revises: 003_point_latest_cagg
+Create Date: 2026-10-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "004_site_latest_window_lateral"
+down_revision = "003_point_latest_cagg"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # One ORDER BY ts_utc DESC LIMIT 1 probe per point on ix_meas_point_time_desc
+    # instead of aggregating a day of rows and joining back to measurements.
+    op.execute("""
+    CREATE OR REPLACE VIEW v_site_latest_window AS
+    SELECT m.*
+    FROM points p
+    JOIN LATERAL (
+      SELECT *
+      FROM measurements
+      WHERE point_id = p.point_id
+        AND ts_utc > now() - interval '1 day'
+      ORDER BY ts_utc DESC
+      LIMIT 1
+    ) m ON true
+    WHERE p.active;
+    """)
+
+
+def downgrade():
+    op.execute("""
+    CREATE OR REPLACE VIEW v_site_latest_window AS
+    SELECT m.*
+    FROM measurements m
+    JOIN (
+      SELECT point_id, max(ts_utc) AS last_ts
+      FROM measurements
+      WHERE ts_utc > now() - interval '1 day'
+      GROUP BY point_id
+    ) t ON t.point_id = m.point_id AND t.last_ts = m.ts_utc;
+    """)
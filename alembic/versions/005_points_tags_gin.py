@@ -0,0 +1,34 @@
+"""add jsonb_path_ops GIN index on points.tags
+
+Tag lookups must use containment to hit this index:
+
+    WHERE tags @> '{"zone": "vav-1"}'
+
+An extraction comparison such as tags->>'zone' = 'vav-1' cannot use it
+and falls back to a sequential scan of points.
+
+Revision ID: 005_points_tags_gin
+Revises: 004_site_latest_window_lateral
+Create Date: 2026-10-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "005_points_tags_gin"
+down_revision = "004_site_latest_window_lateral"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # jsonb_path_ops only supports @> (and jsonpath) but is smaller and faster than jsonb_ops.
+    # CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_points_tags_gin ON points USING GIN (tags jsonb_path_ops);")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_points_tags_gin;")
@@ -0,0 +1,34 @@
+"""add partial expression index on points.tags->>'equip_ref'
+
+Equality lookups on a hot tag path are cheaper on a narrow B-tree than on
+the GIN index. The index is partial, so queries must include the same
+predicate to use it:
+
+    WHERE tags->>'equip_ref' = 'ahu-2' AND active
+
+Keep INDEXED_TAG_PATHS in lambda_function.py in sync with this migration.
+
+Revision ID: 006_points_equip_ref_idx
+Revises: 005_points_tags_gin
+Create Date: 2026-10-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "006_points_equip_ref_idx"
+down_revision = "005_points_tags_gin"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_points_equip_ref ON points ((tags->>'equip_ref')) WHERE active;")
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_points_equip_ref;")
@@ -0,0 +1,47 @@
+"""tune device_state storage for heartbeat UPSERTs
+
+Every heartbeat rewrites the same device_state row. Leaving 20% free space
+per page lets PostgreSQL keep the new row version on the same page, and
+aggressive autovacuum settings reclaim dead versions before the table bloats.
+
+Revision ID: 007_device_state_fillfactor
+Revises: 006_points_equip_ref_idx
+Create Date: 2026-10-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "007_device_state_fillfactor"
+down_revision = "006_points_equip_ref_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+    ALTER TABLE device_state SET (
+        fillfactor = 80,
+        autovacuum_vacuum_scale_factor = 0.02,
+        autovacuum_analyze_scale_factor = 0.01,
+        autovacuum_vacuum_cost_delay = 2
+    );
+    """)
+
+    # fillfactor only applies to new pages; rewrite once so existing rows get the free space.
+    # CLUSTER holds ACCESS EXCLUSIVE on device_state; commit it on its own so the lock
+    # isn't held through the later measurements migrations and heartbeats don't block.
+    with op.get_context().autocommit_block():
+        op.execute("CLUSTER device_state USING device_state_pkey;")
+
+
+def downgrade():
+    op.execute("""
+    ALTER TABLE device_state RESET (
+        fillfactor,
+        autovacuum_vacuum_scale_factor,
+        autovacuum_analyze_scale_factor,
+        autovacuum_vacuum_cost_delay
+    );
+    """)
@@ -0,0 +1,46 @@
+"""compress measurements segmented by (site_id, point_id), ordered by ts_utc DESC
+
+Segmenting on the query key lets (point_id, ts_utc) range scans decompress
+only the matching segment, and per-point runs of values compress better
+than the default layout.
+
+Revision ID: 008_measurements_compress_segmentby
+Revises: 007_device_state_fillfactor
+Create Date: 2026-10-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "008_measurements_compress_segmentby"
+down_revision = "007_device_state_fillfactor"
+branch_labels = None
+depends_on = None
+
+# Matches the add_compression_policy interval from 002_init_hvac_timescale
+COMPRESS_AFTER = "7 days"
+
+
+def _set_compression(segmentby, orderby):
+    # Compression settings can't change while chunks are compressed
+    op.execute("SELECT decompress_chunk(c, if_compressed => TRUE) FROM show_chunks('measurements') c;")
+    op.execute(f"""
+    ALTER TABLE measurements SET (
+        timescaledb.compress,
+        timescaledb.compress_segmentby = '{segmentby}',
+        timescaledb.compress_orderby = '{orderby}'
+    );
+    """)
+    op.execute(f"""
+    SELECT compress_chunk(c, if_not_compressed => TRUE)
+    FROM show_chunks('measurements', older_than => interval '{COMPRESS_AFTER}') c;
+    """)
+
+
+def upgrade():
+    _set_compression("site_id, point_id", "ts_utc DESC")
+
+
+def downgrade():
+    _set_compression("", "ts_utc DESC")
@@ -0,0 +1,147 @@
+"""drop denormalized point_name/unit from measurements
+
+measurements is the widest and largest table in the schema and must stay
+normalized: one row is (site_id, point_id, ts_utc, value, quality) plus
+bookkeeping, nothing that can be looked up in points. Copying point_name and
+unit onto every sample costs bytes per tuple, WAL, COPY throughput and
+compression ratio, and lets the copies drift from points. Views that need
+point metadata join points on point_id.
+
+Revision ID: 009_measurements_drop_denorm_cols
+Revises: 008_measurements_compress_segmentby
+Create Date: 2026-10-14
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "009_measurements_drop_denorm_cols"
+down_revision = "008_measurements_compress_segmentby"
+branch_labels = None
+depends_on = None
+
+# Matches the add_compression_policy interval from 002_init_hvac_timescale
+COMPRESS_AFTER = "7 days"
+
+
+def _drop_views():
+    op.execute("DROP VIEW IF EXISTS v_site_latest_window;")
+    op.execute("DROP VIEW IF EXISTS v_point_latest;")
+    op.execute("SELECT remove_continuous_aggregate_policy('v_point_latest_hourly', if_exists => TRUE);")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS v_point_latest_hourly;")
+
+
+def _create_point_latest_hourly(extra_columns=""):
+    op.execute(f"""
+    CREATE MATERIALIZED VIEW v_point_latest_hourly
+    WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+    SELECT
+      time_bucket('1 hour', m.ts_utc) AS bucket,
+      m.site_id,
+      m.point_id,{extra_columns}
+      last(m.value, m.ts_utc) AS value,
+      last(m.quality, m.ts_utc) AS quality,
+      max(m.ts_utc) AS last_ts_utc
+    FROM measurements m
+    GROUP BY bucket, m.site_id, m.point_id
+    WITH NO DATA;
+    """)
+    op.execute("""
+    SELECT add_continuous_aggregate_policy(
+        'v_point_latest_hourly',
+        start_offset => INTERVAL '2 days',
+        end_offset => INTERVAL '1 hour',
+        schedule_interval => INTERVAL '5 minutes',
+        if_not_exists => TRUE
+    );
+    """)
+
+
+def _recompress_and_refresh():
+    op.execute(f"""
+    SELECT compress_chunk(c, if_not_compressed => TRUE)
+    FROM show_chunks('measurements', older_than => interval '{COMPRESS_AFTER}') c;
+    """)
+    # refresh cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.execute("CALL refresh_continuous_aggregate('v_point_latest_hourly', NULL, NULL);")
+
+
+def upgrade():
+    _drop_views()
+
+    op.execute("SELECT decompress_chunk(c, if_compressed => TRUE) FROM show_chunks('measurements') c;")
+    op.drop_column("measurements", "point_name")
+    op.drop_column("measurements", "unit")
+
+    _create_point_latest_hourly()
+
+    op.execute("""
+    CREATE OR REPLACE VIEW v_point_latest AS
+    SELECT DISTINCT ON (l.point_id)
+      l.point_id, l.site_id, p.point_name, p.unit,
+      l.last_ts_utc, l.value, l.quality
+    FROM v_point_latest_hourly l
+    JOIN points p ON p.point_id = l.point_id
+    ORDER BY l.point_id, l.bucket DESC;
+    """)
+
+    op.execute("""
+    CREATE OR REPLACE VIEW v_site_latest_window AS
+    SELECT
+      m.site_id, m.point_id, p.point_name, p.unit, m.ts_utc,
+      m.value, m.quality, m.schema_version, m.meta_hash
+    FROM points p
+    JOIN LATERAL (
+      SELECT *
+      FROM measurements
+      WHERE point_id = p.point_id
+        AND ts_utc > now() - interval '1 day'
+      ORDER BY ts_utc DESC
+      LIMIT 1
+    ) m ON true
+    WHERE p.active;
+    """)
+
+    _recompress_and_refresh()
+
+
+def downgrade():
+    _drop_views()
+
+    # Columns come back empty; the old values are not recoverable
+    op.execute("SELECT decompress_chunk(c, if_compressed => TRUE) FROM show_chunks('measurements') c;")
+    op.add_column("measurements", sa.Column("point_name", sa.Text()))
+    op.add_column("measurements", sa.Column("unit", sa.Text()))
+
+    _create_point_latest_hourly("""
+      last(m.point_name, m.ts_utc) AS point_name,
+      last(m.unit, m.ts_utc) AS unit,""")
+
+    op.execute("""
+    CREATE OR REPLACE VIEW v_point_latest AS
+    SELECT DISTINCT ON (l.point_id)
+      l.point_id, l.site_id, l.point_name, l.unit,
+      l.last_ts_utc, l.value, l.quality
+    FROM v_point_latest_hourly l
+    ORDER BY l.point_id, l.bucket DESC;
+    """)
+
+    op.execute("""
+    CREATE OR REPLACE VIEW v_site_latest_window AS
+    SELECT m.*
+    FROM points p
+    JOIN LATERAL (
+      SELECT *
+      FROM measurements
+      WHERE point_id = p.point_id
+        AND ts_utc > now() - interval '1 day'
+      ORDER BY ts_utc DESC
+      LIMIT 1
+    ) m ON true
+    WHERE p.active;
+    """)
+
+    _recompress_and_refresh()
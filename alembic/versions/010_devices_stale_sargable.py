@@ -0,0 +1,37 @@
+"""make v_devices_stale's filter index-friendly
+
+now() - last_seen_ts > interval '120 seconds' hides the column inside an
+expression, so no index on last_seen_ts can be used. Comparing the bare
+column against now() - interval lets ix_devstate_last_seen serve it.
+
+Revision ID: 010_devices_stale_sargable
+Revises: 009_measurements_drop_denorm_cols
+Create Date: 2026-10-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "010_devices_stale_sargable"
+down_revision = "009_measurements_drop_denorm_cols"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+    CREATE OR REPLACE VIEW v_devices_stale AS
+    SELECT device_id, site_id, last_seen_ts, now() - last_seen_ts AS age
+    FROM device_state
+    WHERE last_seen_ts < now() - interval '120 seconds';
+    """)
+
+
+def downgrade():
+    op.execute("""
+    CREATE OR REPLACE VIEW v_devices_stale AS
+    SELECT device_id, site_id, last_seen_ts, now() - last_seen_ts AS age
+    FROM device_state
+    WHERE now() - last_seen_ts > interval '120 seconds';
+    """)
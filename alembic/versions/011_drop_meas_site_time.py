@@ -0,0 +1,29 @@
+"""drop redundant ix_meas_site_time
+
+site_id is the hypertable's space partition and ts_utc its time dimension,
+so site/time range predicates already prune chunks, and create_hypertable's
+default (site_id, ts_utc DESC) index plus the (site_id, point_id, ts_utc)
+primary key cover what is left. ix_meas_point_time_desc stays: point-only
+lookups can't prune by space partition.
+
+Revision ID: 011_drop_meas_site_time
+Revises: 010_devices_stale_sargable
+Create Date: 2026-10-14
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "011_drop_meas_site_time"
+down_revision = "010_devices_stale_sargable"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_index("ix_meas_site_time", table_name="measurements")
+
+
+def downgrade():
+    op.create_index("ix_meas_site_time", "measurements", ["site_id", "ts_utc"])
@@ -1,13 +1,363 @@
+import functools
+import io
 import json
+import orjson
 import os
 import psycopg2
-from datetime import datetime
+import psycopg2.errors
+import struct
+from datetime import datetime, timezone
 import logging
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# ON CONFLICT clause for the COPY-staged UPSERT; optional fields that were
+# not sent (NULL) keep their stored value
+UPSERT_CONFLICT_SQL = """
+    ON CONFLICT (device_id) 
+    DO UPDATE SET
+        last_seen_ts = NOW(),
+        status = COALESCE(EXCLUDED.status, device_state.status),
+        agent_version = COALESCE(EXCLUDED.agent_version, device_state.agent_version),
+        cpu_pct = COALESCE(EXCLUDED.cpu_pct, device_state.cpu_pct),
+        disk_free_gb = COALESCE(EXCLUDED.disk_free_gb, device_state.disk_free_gb),
+        queue_depth = COALESCE(EXCLUDED.queue_depth, device_state.queue_depth),
+        poll_interval_s = COALESCE(EXCLUDED.poll_interval_s, device_state.poll_interval_s),
+        last_upload_ts = COALESCE(EXCLUDED.last_upload_ts, device_state.last_upload_ts),
+        updated_at = NOW()
+"""
+
+# Alive-only heartbeats (no optional fields) skip the UPSERT and set only the two
+# timestamps, leaving the optional columns untouched. This is still a regular
+# (non-HOT) update, since ix_devstate_last_seen indexes last_seen_ts. RETURNING
+# tells us which devices still need their first device_state row.
+PREPARE_PING_SQL = """
+    PREPARE hb_ping (text[]) AS
+    UPDATE device_state
+    SET last_seen_ts = NOW(), updated_at = NOW()
+    WHERE device_id = ANY($1)
+    RETURNING device_id
+"""
+
+EXECUTE_PING_SQL = "EXECUTE hb_ping (%s::text[])"
+
+# Batches at or above this size are staged with COPY instead of array parameters
+COPY_THRESHOLD = 100
+
+# Optional heartbeat fields and their PostgreSQL types, in row tuple order
+OPTIONAL_COLUMNS = (
+    ('status', 'text'),
+    ('agent_version', 'text'),
+    ('cpu_pct', 'float8'),
+    ('disk_free_gb', 'float8'),
+    ('queue_depth', 'int4'),
+    ('poll_interval_s', 'int4'),
+    ('last_upload_ts', 'timestamptz'),
+)
+
+# Heartbeat columns in the order they appear in each row tuple
+HEARTBEAT_COLUMNS = (
+    'device_id', 'site_id', 'status', 'agent_version', 'cpu_pct',
+    'disk_free_gb', 'queue_depth', 'poll_interval_s', 'last_upload_ts'
+)
+
+# Session-local staging table; temp tables skip WAL and ON COMMIT DROP cleans up for us.
+# Columns are declared explicitly because LIKE device_state would carry over NOT NULL
+# on last_seen_ts, which is only filled in by the UPSERT below.
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE _hb (
+        device_id TEXT,
+        site_id TEXT,
+        status TEXT,
+        agent_version TEXT,
+        cpu_pct FLOAT8,
+        disk_free_gb FLOAT8,
+        queue_depth INTEGER,
+        poll_interval_s INTEGER,
+        last_upload_ts TIMESTAMPTZ
+    ) ON COMMIT DROP
+"""
+
+UPSERT_FROM_STAGING_SQL = """
+    INSERT INTO device_state (
+        device_id, site_id, last_seen_ts, status, agent_version, 
+        cpu_pct, disk_free_gb, queue_depth, poll_interval_s, 
+        last_upload_ts, updated_at
+    )
+    SELECT
+        device_id, site_id, NOW(), status, agent_version,
+        cpu_pct, disk_free_gb, queue_depth, poll_interval_s,
+        last_upload_ts, NOW()
+    FROM _hb
+""" + UPSERT_CONFLICT_SQL
+
+# Tag paths with a dedicated B-tree expression index on points (see migration 006).
+# These are partial indexes: filter with (tags->>'<path>') = %s AND active to use them,
+# anything else should go through tag_filter_clause and the GIN index.
+INDEXED_TAG_PATHS = {
+    'equip_ref': 'ix_points_equip_ref',
+}
+
+# Connection cached at module scope so warm Lambda invocations skip TCP/TLS/auth setup
+_CONN = None
+
+# Per-field-set UPSERT statements already PREPAREd on the current connection
+_PREPARED = set()
+
+
+def _get_conn():
+    """Return the cached database connection, (re)connecting if it is missing or closed"""
+    global _CONN
+    if _CONN is None or _CONN.closed:
+        # Get database connection parameters from environment variables
+        conn = psycopg2.connect(
+            host=os.environ['DB_HOST'],
+            port=os.environ.get('DB_PORT', '5432'),
+            database=os.environ['DB_NAME'],
+            user=os.environ['DB_USER'],
+            password=os.environ['DB_PASSWORD'],
+            keepalives=1,
+            keepalives_idle=30,
+            # This session only writes heartbeats, which are idempotent and re-sent every
+            # poll interval, so commits don't wait for the WAL flush. A crash can lose the
+            # last few hundred ms of acknowledged heartbeats, never corrupt data. Set at
+            # startup instead of SET LOCAL per transaction to avoid an extra round-trip.
+            options='-c synchronous_commit=off'
+        )
+        # Only cache a fully prepared session; a failed PREPARE would leave it mid-transaction
+        try:
+            _prepare_statements(conn)
+        except Exception:
+            conn.close()
+            raise
+        _CONN = conn
+    return _CONN
+
+
+def _prepare_statements(conn):
+    """PREPARE the heartbeat statements on a new session"""
+    # UPSERT variants are prepared lazily, per observed field set; start from a
+    # clean slate so _PREPARED matches the session
+    _PREPARED.clear()
+    with conn.cursor() as cursor:
+        cursor.execute("DEALLOCATE ALL")
+        cursor.execute(PREPARE_PING_SQL)
+    conn.commit()
+
+
+@functools.lru_cache(maxsize=64)
+def build_upsert(keys):
+    """
+    Build the UPSERT for heartbeats carrying exactly the optional fields in keys.
+    
+    Only the columns that were sent are inserted and updated, so nothing else in
+    the row is rewritten. Returns (name, positions, prepare_sql, execute_sql);
+    positions are the row tuple indexes to pass, and name is unique per key set.
+    """
+    optional = [
+        (i, column, pg_type)
+        for i, (column, pg_type) in enumerate(OPTIONAL_COLUMNS)
+        if column in keys
+    ]
+    name = 'hb_upsert_%d' % sum(1 << i for i, _, _ in optional)
+    positions = (0, 1) + tuple(2 + i for i, _, _ in optional)
+    columns = ['device_id', 'site_id'] + [column for _, column, _ in optional]
+    types = ['text', 'text'] + [pg_type for _, _, pg_type in optional]
+    
+    column_list = ', '.join(columns)
+    updates = ''.join(f'{column} = EXCLUDED.{column}, ' for _, column, _ in optional)
+    prepare_sql = f"""
+        PREPARE {name} ({', '.join(t + '[]' for t in types)}) AS
+        INSERT INTO device_state ({column_list}, last_seen_ts, updated_at)
+        SELECT {column_list}, NOW(), NOW()
+        FROM unnest({', '.join(f'${n}' for n in range(1, len(columns) + 1))}) AS hb ({column_list})
+        ON CONFLICT (device_id)
+        DO UPDATE SET {updates}last_seen_ts = NOW(), updated_at = NOW()
+    """
+    # Explicit casts coerce the adapted arrays (e.g. ISO timestamp strings, mixed
+    # int/float numerics) to the prepared parameter types
+    execute_sql = f"EXECUTE {name} ({', '.join(f'%s::{t}[]' for t in types)})"
+    return name, positions, prepare_sql, execute_sql
+
+
+def _reset_conn():
+    """Roll back and discard the cached connection"""
+    global _CONN
+    if _CONN is not None:
+        try:
+            _CONN.rollback()
+            _CONN.close()
+        except psycopg2.Error:
+            pass
+    _CONN = None
+    _PREPARED.clear()
+
+
+def _copy_text_value(value):
+    """Render a value for COPY text format (tab separated, \\N for NULL)"""
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def upsert_heartbeats(cursor, rows):
+    """
+    Write heartbeat rows to device_state in as few round-trips as possible.
+    
+    Rows with no optional fields are a narrow timestamp UPDATE (hb_ping); the
+    rest, plus pings for devices without a row yet, are UPSERTed:
+    
+    - small batches: one multi-statement query of prepared EXECUTEs, one per
+      optional-field set (see build_upsert)
+    - large batches: COPY into the _hb temp table, then one
+      INSERT ... SELECT ... ON CONFLICT merge
+    """
+    # Pick the path up front so a large batch can create its staging table in the
+    # same round-trip as the ping UPDATE (the ping's RETURNING rows come back last)
+    use_copy = len(rows) >= COPY_THRESHOLD
+    ping_ids = [row[0] for row in rows if all(v is None for v in row[2:])]
+    if ping_ids:
+        ping_sql = cursor.mogrify(EXECUTE_PING_SQL, (ping_ids,))
+        if use_copy:
+            ping_sql = STAGING_TABLE_SQL.encode() + b';\n' + ping_sql
+        cursor.execute(ping_sql)
+        seen = {r[0] for r in cursor.fetchall()}
+        rows = [
+            row for row in rows
+            if row[0] not in seen or any(v is not None for v in row[2:])
+        ]
+    elif use_copy:
+        cursor.execute(STAGING_TABLE_SQL)
+    
+    if not rows:
+        return
+    
+    if not use_copy:
+        groups = {}
+        for row in rows:
+            keys = frozenset(
+                column for (column, _), value in zip(OPTIONAL_COLUMNS, row[2:])
+                if value is not None
+            )
+            groups.setdefault(keys, []).append(row)
+        
+        # Send any missing PREPAREs and every group's EXECUTE as one multi-statement
+        # query, so the UPSERTs cost a single round-trip however many groups there are
+        statements = []
+        new_names = []
+        for keys, group in groups.items():
+            name, positions, prepare_sql, execute_sql = build_upsert(keys)
+            if name not in _PREPARED and name not in new_names:
+                statements.append(prepare_sql.encode())
+                new_names.append(name)
+            columns = list(zip(*group))
+            statements.append(cursor.mogrify(execute_sql, [list(columns[i]) for i in positions]))
+        cursor.execute(b';\n'.join(statements))
+        _PREPARED.update(new_names)
+        return
+    
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(_copy_text_value(v) for v in row))
+        buf.write('\n')
+    buf.seek(0)
+    
+    cursor.copy_from(buf, '_hb', columns=HEARTBEAT_COLUMNS)
+    cursor.execute(UPSERT_FROM_STAGING_SQL)
+
+
+def _write_heartbeats(conn, rows):
+    with conn.cursor() as cursor:
+        # Ping UPDATE, then one query for all UPSERT groups (or COPY + merge for
+        # large batches), instead of one round-trip per device
+        upsert_heartbeats(cursor, rows)
+        
+        conn.commit()
+
+
+def tag_filter_clause(tags):
+    """
+    Build an indexable filter on points.tags for the given {key: value} pairs.
+
+    Returns (sql, params) for cursor.execute, e.g.
+        sql, params = tag_filter_clause({'zone': 'vav-1', 'equip_ref': 'ahu-2'})
+        cursor.execute(f"SELECT point_id FROM points WHERE {sql}", params)
+
+    All keys are merged into one object so a single tags @> containment test
+    can use ix_points_tags_gin; tags->>'key' = 'val' comparisons cannot.
+    """
+    return "tags @> %s::jsonb", (json.dumps(dict(tags)),)
+
+
+# Binary COPY of measurements; beyond ~10k rows per COPY throughput plateaus
+MEASUREMENTS_COPY_SQL = "COPY measurements (site_id, point_id, ts_utc, value, quality) FROM STDIN WITH (FORMAT BINARY)"
+MEASUREMENTS_COPY_CHUNK = 10000
+
+_PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_PGCOPY_TRAILER = struct.pack('>h', -1)
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_NULL_FIELD = struct.pack('>i', -1)
+
+
+def _pack_measurement(site_id, point_id, ts_utc, value, quality):
+    """Encode one (text, text, timestamptz, float8, int4) tuple in PG binary COPY format"""
+    site = site_id.encode('utf-8')
+    point = point_id.encode('utf-8')
+    if ts_utc.tzinfo is None:
+        ts_utc = ts_utc.replace(tzinfo=timezone.utc)
+    delta = ts_utc - _PG_EPOCH
+    # timestamptz is int64 microseconds since 2000-01-01 UTC
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    
+    parts = [
+        struct.pack('>hi', 5, len(site)), site,
+        struct.pack('>i', len(point)), point,
+        struct.pack('>iq', 8, micros),
+        _NULL_FIELD if value is None else struct.pack('>id', 8, value),
+        _NULL_FIELD if quality is None else struct.pack('>ii', 4, quality),
+    ]
+    return b''.join(parts)
+
+
+def bulk_copy_measurements(cursor, rows):
+    """
+    Bulk insert measurements with binary COPY, in chunks of MEASUREMENTS_COPY_CHUNK rows.
+    
+    rows are (site_id, point_id, ts_utc, value, quality) tuples; naive ts_utc
+    datetimes are taken as UTC. The caller owns the transaction. Returns the
+    number of rows copied.
+    """
+    copied = 0
+    chunk = []
+    for row in rows:
+        chunk.append(_pack_measurement(*row))
+        if len(chunk) >= MEASUREMENTS_COPY_CHUNK:
+            copied += _copy_measurement_chunk(cursor, chunk)
+            chunk = []
+    if chunk:
+        copied += _copy_measurement_chunk(cursor, chunk)
+    return copied
+
+
+def _copy_measurement_chunk(cursor, packed_rows):
+    buf = io.BytesIO()
+    buf.write(_PGCOPY_HEADER)
+    for packed in packed_rows:
+        buf.write(packed)
+    buf.write(_PGCOPY_TRAILER)
+    buf.seek(0)
+    cursor.copy_expert(MEASUREMENTS_COPY_SQL, buf)
+    return len(packed_rows)
+
+
 def lambda_handler(event, context):
     """
     AWS Lambda function to update device heartbeat in device_state table
@@ -34,13 +384,6 @@ def lambda_handler(event, context):
     """
     
     try:
-        # Get database connection parameters from environment variables
-        db_host = os.environ['DB_HOST']
-        db_port = os.environ.get('DB_PORT', '5432')
-        db_name = os.environ['DB_NAME']
-        db_user = os.environ['DB_USER']
-        db_password = os.environ['DB_PASSWORD']
-        
         # Handle both single device and multiple devices
         devices_to_update = []
         
@@ -62,76 +405,87 @@ def lambda_handler(event, context):
             
             devices_to_update = [event]
         
-        # Connect to database
-        conn = psycopg2.connect(
-            host=db_host,
-            port=db_port,
-            database=db_name,
-            user=db_user,
-            password=db_password
-        )
+        # Reuse the warm container's connection when there is one
+        conn = _get_conn()
         
+        rows_by_device = {}
         updated_devices = []
         
-        with conn.cursor() as cursor:
-            for device_data in devices_to_update:
-                device_id = device_data.get('device_id')
-                site_id = device_data.get('site_id')
-                
-                if not device_id or not site_id:
-                    logger.warning(f"Skipping device with missing device_id or site_id: {device_data}")
-                    continue
-                
-                # Optional fields
-                status = device_data.get('status')
-                agent_version = device_data.get('agent_version')
-                cpu_pct = device_data.get('cpu_pct')
-                disk_free_gb = device_data.get('disk_free_gb')
-                queue_depth = device_data.get('queue_depth')
-                poll_interval_s = device_data.get('poll_interval_s')
-                last_upload_ts = device_data.get('last_upload_ts')
-                
-                # Use UPSERT (INSERT ... ON CONFLICT) to handle both new and existing devices
-                upsert_sql = """
-                    INSERT INTO device_state (
-                        device_id, site_id, last_seen_ts, status, agent_version, 
-                        cpu_pct, disk_free_gb, queue_depth, poll_interval_s, 
-                        last_upload_ts, updated_at
-                    ) VALUES (
-                        %s, %s, NOW(), %s, %s, %s, %s, %s, %s, %s, NOW()
-                    )
-                    ON CONFLICT (device_id) 
-                    DO UPDATE SET
-                        last_seen_ts = NOW(),
-                        status = COALESCE(EXCLUDED.status, device_state.status),
-                        agent_version = COALESCE(EXCLUDED.agent_version, device_state.agent_version),
-                        cpu_pct = COALESCE(EXCLUDED.cpu_pct, device_state.cpu_pct),
-                        disk_free_gb = COALESCE(EXCLUDED.disk_free_gb, device_state.disk_free_gb),
-                        queue_depth = COALESCE(EXCLUDED.queue_depth, device_state.queue_depth),
-                        poll_interval_s = COALESCE(EXCLUDED.poll_interval_s, device_state.poll_interval_s),
-                        last_upload_ts = COALESCE(EXCLUDED.last_upload_ts, device_state.last_upload_ts),
-                        updated_at = NOW()
-                """
-                
-                cursor.execute(upsert_sql, (
-                    device_id, site_id, status, agent_version, 
-                    cpu_pct, disk_free_gb, queue_depth, poll_interval_s, last_upload_ts
-                ))
-                
-                updated_devices.append(device_id)
-                logger.info(f"Updated heartbeat for device {device_id}")
+        for device_data in devices_to_update:
+            device_id = device_data.get('device_id')
+            site_id = device_data.get('site_id')
+            
+            if not device_id or not site_id:
+                logger.warning(f"Skipping device with missing device_id or site_id: {device_data}")
+                continue
             
-            conn.commit()
+            # Optional fields
+            row = (
+                device_id,
+                site_id,
+                device_data.get('status'),
+                device_data.get('agent_version'),
+                device_data.get('cpu_pct'),
+                device_data.get('disk_free_gb'),
+                device_data.get('queue_depth'),
+                device_data.get('poll_interval_s'),
+                device_data.get('last_upload_ts')
+            )
+            
+            # A single INSERT ... ON CONFLICT cannot touch the same row twice, so fold
+            # repeated heartbeats for a device together (later non-null values win)
+            previous = rows_by_device.get(device_id)
+            if previous is not None:
+                row = previous[:2] + tuple(
+                    new if new is not None else old
+                    for old, new in zip(previous[2:], row[2:])
+                )
+            rows_by_device[device_id] = row
+            updated_devices.append(device_id)
+        
+        rows = list(rows_by_device.values())
         
-        conn.close()
+        for attempt in range(2):
+            try:
+                try:
+                    _write_heartbeats(conn, rows)
+                except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.DuplicatePreparedStatement):
+                    # Session and _PREPARED disagree (statements lost to a proxy reset, or a PREPARE
+                    # that outlived a failed batch); start the session's statements over and retry once
+                    conn.rollback()
+                    _prepare_statements(conn)
+                    _write_heartbeats(conn, rows)
+                break
+            except (psycopg2.InterfaceError, psycopg2.OperationalError):
+                # The cached socket can die while the container is frozen (idle timeout,
+                # failover, proxy reset) without psycopg2 noticing. Heartbeats are
+                # idempotent, so reconnect and write the batch once more.
+                _reset_conn()
+                if attempt:
+                    raise
+                conn = _get_conn()
+            except Exception:
+                # Don't leave a half-done transaction on the cached connection
+                conn.rollback()
+                raise
         
+        # One aggregated line per batch rather than one per device
+        logger.info(
+            "heartbeat batch updated: %d device(s)",
+            len(updated_devices),
+            extra={'count': len(updated_devices), 'sample': updated_devices[:5]}
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Updated heartbeat for devices: %s", updated_devices)
+        
+        # orjson serializes large device lists far faster and handles datetimes natively
         return {
             'statusCode': 200,
-            'body': json.dumps({
+            'body': orjson.dumps({
                 'message': f'Heartbeat updated for {len(updated_devices)} device(s)',
                 'updated_devices': updated_devices,
-                'timestamp': datetime.utcnow().isoformat()
-            })
+                'timestamp': datetime.utcnow()
+            }).decode()
         }
         
     except psycopg2.Error as db_error:
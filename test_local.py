@@ -8,9 +8,11 @@ mirroring alembic.ini settings.
 
 import os
 import json
-from datetime import datetime
+import re
+from datetime import datetime, timedelta, timezone
 import psycopg2
 
+import lambda_function
 from lambda_function import lambda_handler
 
 
@@ -23,64 +25,53 @@ def set_env_from_alembic_defaults() -> None:
     os.environ.setdefault("DB_PASSWORD", "yourpassword")
 
 
-def check_connection() -> bool:
+def connect():
     try:
-        conn = psycopg2.connect(
+        return psycopg2.connect(
             host=os.environ["DB_HOST"],
             port=os.environ["DB_PORT"],
             database=os.environ["DB_NAME"],
             user=os.environ["DB_USER"],
             password=os.environ["DB_PASSWORD"],
         )
+    except Exception as exc:
+        print(f"Connection failed: {exc}")
+        return None
+
+
+def check_connection(conn) -> bool:
+    try:
         with conn.cursor() as cur:
-            cur.execute("SELECT version();")
-            version = cur.fetchone()[0]
-            print(f"Connected to PostgreSQL: {version}")
-        conn.close()
+            cur.execute("SELECT 1;")
+            cur.fetchone()
+        # Reported by libpq at connect time, no query needed
+        print(f"Connected to PostgreSQL: server_version {conn.server_version}")
+        conn.rollback()
         return True
     except Exception as exc:
+        conn.rollback()
         print(f"Connection failed: {exc}")
         return False
 
 
-def ensure_tables_present() -> bool:
+def ensure_tables_present(conn) -> bool:
     try:
-        conn = psycopg2.connect(
-            host=os.environ["DB_HOST"],
-            port=os.environ["DB_PORT"],
-            database=os.environ["DB_NAME"],
-            user=os.environ["DB_USER"],
-            password=os.environ["DB_PASSWORD"],
-        )
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables
-                    WHERE table_schema = 'public' AND table_name = 'device_state'
-                );
-                """
-            )
+            cur.execute("SELECT to_regclass('public.device_state') IS NOT NULL;")
             exists = cur.fetchone()[0]
-            if not exists:
-                print("Table 'device_state' not found. Run alembic upgrade head.")
-                return False
-        conn.close()
+        conn.rollback()
+        if not exists:
+            print("Table 'device_state' not found. Run alembic upgrade head.")
+            return False
         return True
     except Exception as exc:
+        conn.rollback()
         print(f"Error checking tables: {exc}")
         return False
 
 
-def query_device_state() -> None:
+def query_device_state(conn) -> None:
     try:
-        conn = psycopg2.connect(
-            host=os.environ["DB_HOST"],
-            port=os.environ["DB_PORT"],
-            database=os.environ["DB_NAME"],
-            user=os.environ["DB_USER"],
-            password=os.environ["DB_PASSWORD"],
-        )
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -111,21 +102,66 @@ def query_device_state() -> None:
                     print(" - none")
             except Exception as exc2:
                 print(f"Note: could not query v_devices_stale: {exc2}")
-        conn.close()
+        conn.rollback()
     except Exception as exc:
+        conn.rollback()
         print(f"Query failed: {exc}")
 
 
-def seed_site_and_devices() -> None:
+def check_plan_uses_index(conn, query: str, index_name: str) -> None:
+    """Report whether the planner serves query with index_name."""
+    try:
+        with conn.cursor() as cur:
+            # Small test tables would otherwise always get a seq scan
+            cur.execute("SET LOCAL enable_seqscan = off;")
+            cur.execute(f"EXPLAIN {query}")
+            plan = "\n".join(r[0] for r in cur.fetchall())
+            if index_name in plan:
+                print(f"{query} -> uses {index_name}")
+            else:
+                print(f"WARNING: {query} does not use {index_name}:")
+                print(plan)
+        conn.rollback()
+    except Exception as exc:
+        conn.rollback()
+        print(f"Plan check failed: {exc}")
+
+
+def check_chunk_exclusion(conn) -> None:
+    """Report how many measurements chunks a site/time range query scans."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) FROM show_chunks('measurements');")
+            total = cur.fetchone()[0]
+            # Literal bounds so chunks are excluded at plan time and show up in EXPLAIN
+            end = datetime.now(timezone.utc)
+            cur.execute(
+                """
+                EXPLAIN SELECT * FROM measurements
+                WHERE site_id = %s AND ts_utc BETWEEN %s AND %s;
+                """,
+                ("test-building", end - timedelta(days=1), end),
+            )
+            plan = [r[0] for r in cur.fetchall()]
+            # Distinct chunk tables only; chunk index names share the _hyper_ prefix
+            scanned = len({
+                m.group(1)
+                for line in plan
+                for m in re.finditer(r" on (?:\S+\.)?(_hyper_\d+_\d+_chunk)(?:\s|$)", line)
+            })
+            print(f"site/time range query on measurements scans {scanned} of {total} chunk(s)")
+            if total and scanned >= total:
+                print("WARNING: no chunks excluded:")
+                print("\n".join(plan))
+        conn.rollback()
+    except Exception as exc:
+        conn.rollback()
+        print(f"Chunk exclusion check failed: {exc}")
+
+
+def seed_site_and_devices(conn) -> None:
     """Insert required site and devices for tests if missing."""
     try:
-        conn = psycopg2.connect(
-            host=os.environ["DB_HOST"],
-            port=os.environ["DB_PORT"],
-            database=os.environ["DB_NAME"],
-            user=os.environ["DB_USER"],
-            password=os.environ["DB_PASSWORD"],
-        )
         with conn.cursor() as cur:
             # Ensure site exists
             cur.execute(
@@ -148,13 +184,17 @@ def seed_site_and_devices() -> None:
                     (device_id, "test-building", "test-model"),
                 )
         conn.commit()
-        conn.close()
         print("Seeded required site/devices (if missing).")
     except Exception as exc:
+        conn.rollback()
         print(f"Seeding failed: {exc}")
 
 
-def run_tests() -> None:
+def run_tests(conn) -> None:
+    # Have the handler join this session instead of opening its own connection
+    lambda_function._prepare_statements(conn)
+    lambda_function._get_conn = lambda: conn
+
     single_event = {
         "device_id": "hvac-test-001",
         "site_id": "test-building",
@@ -183,24 +223,34 @@ def main() -> None:
     print(
         f"Using DB {os.environ['DB_USER']}@{os.environ['DB_HOST']}:{os.environ['DB_PORT']}/{os.environ['DB_NAME']}"
     )
-    if not check_connection():
-        return
-    if not ensure_tables_present():
+    # One connection shared by every step, including the handler
+    conn = connect()
+    if conn is None:
         return
+    try:
+        if not check_connection(conn):
+            return
+        if not ensure_tables_present(conn):
+            return
+
+        # Seed minimal data required for FK constraints
+        seed_site_and_devices(conn)
 
-    # Seed minimal data required for FK constraints
-    seed_site_and_devices()
+        print("\nBefore updates:")
+        query_device_state(conn)
 
-    print("\nBefore updates:")
-    query_device_state()
+        run_tests(conn)
 
-    run_tests()
+        print("\nAfter updates:")
+        query_device_state(conn)
 
-    print("\nAfter updates:")
-    query_device_state()
+        print("\nQuery plans:")
+        check_plan_uses_index(conn, "SELECT * FROM v_site_latest_window", "ix_meas_point_time_desc")
+        check_plan_uses_index(conn, "SELECT * FROM v_devices_stale", "ix_devstate_last_seen")
+        check_chunk_exclusion(conn)
+    finally:
+        conn.close()
 
 
 if __name__ == "__main__":
     main()
-
-